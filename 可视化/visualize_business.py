@@ -18,6 +18,9 @@ driver_business_viz.py
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+import joblib
+import numpy as np
 import pandas as pd
 from pyecharts import options as opts
 from pyecharts.charts import Bar, Pie, TreeMap, Sankey
@@ -30,8 +33,15 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 # 加载所有 sheet
 
 def load_sheets(path):
-    xls = pd.ExcelFile(path)
-    return {sheet: pd.read_excel(xls, sheet) for sheet in xls.sheet_names}
+    # sheet_name=None 一次解析返回 {sheet名: DataFrame}，calamine 为 Rust 实现的读取引擎
+    return pd.read_excel(path, sheet_name=None, engine="calamine")
+
+# 以 (路径, 修改时间) 为键缓存到磁盘，Excel 未变化时直接复用上次解析结果
+memory = joblib.Memory(os.path.join(OUTPUT_DIR, ".cache"), verbose=0)
+
+@memory.cache
+def load_sheets_cached(path, mtime):
+    return load_sheets(path)
 
 # 保存图表到 HTML
 
@@ -99,7 +109,7 @@ def chart_amount_range(df):
 # 5. 订单状态分布 (Pie)
 
 def chart_order_status(df):
-    data = [[str(row[df.columns[0]]), row[df.columns[1]]] for _, row in df.iterrows()]
+    data = list(map(list, zip(df.iloc[:, 0].astype(str).tolist(), df.iloc[:, 1].tolist())))
     pie = (
         Pie()
         .add("", data)
@@ -128,7 +138,7 @@ def chart_rating(df):
 # 7. 迟到分布 (Pie)
 
 def chart_late(df):
-    data = [[str(row[df.columns[0]]), row[df.columns[1]]] for _, row in df.iterrows()]
+    data = list(map(list, zip(df.iloc[:, 0].astype(str).tolist(), df.iloc[:, 1].tolist())))
     pie = (
         Pie()
         .add("", data)
@@ -158,11 +168,12 @@ def chart_flow(df, min_value: int = 3) -> None:
             .assign(**{
                 src: lambda d: d[src].astype(str).str.strip(),
                 tgt: lambda d: d[tgt].astype(str).str.strip(),
-                val: lambda d: pd.to_numeric(d[val], errors='coerce')
+                val: lambda d: pd.to_numeric(d[val], errors='coerce', downcast='integer')
             })
             .dropna()
             .loc[lambda d: d[src] != d[tgt]]         # 去自循环
-            .groupby([src, tgt], as_index=False)[val]
+            .astype({src: 'category', tgt: 'category'})  # 按整数编码分组
+            .groupby([src, tgt], as_index=False, observed=True, sort=False)[val]
             .sum()
             .loc[lambda d: d[val] >= min_value])     # 过滤小流量
 
@@ -171,9 +182,9 @@ def chart_flow(df, min_value: int = 3) -> None:
         return
 
     # 2️⃣ 构造节点 & 链接
-    nodes = [{'name': n} for n in { *flow[src], *flow[tgt] }]
-    links = flow.rename(columns={src: 'source', tgt: 'target'})[['source', 'target', val]] \
-                .to_dict(orient='records')
+    nodes = [{'name': n} for n in pd.unique(np.concatenate([flow[src].to_numpy(), flow[tgt].to_numpy()]))]
+    links = [{'source': s, 'target': t, 'value': v}
+             for s, t, v in zip(flow[src].tolist(), flow[tgt].tolist(), flow[val].tolist())]
 
     # 3️⃣ 绘制 Sankey
     sankey = (
@@ -210,10 +221,11 @@ def chart_flow(df, min_value: int = 3) -> None:
 def chart_type_compare(df):
     src_col = '结构化业务类型'
     tgt_col = '订单类型'
-    cnt = df.groupby([src_col, tgt_col]).size().reset_index(name='value')
-    nodes = list(set(cnt[src_col]).union(cnt[tgt_col]))
+    cnt = df.value_counts([src_col, tgt_col]).reset_index(name='value')
+    nodes = pd.unique(np.concatenate([cnt[src_col].to_numpy(), cnt[tgt_col].to_numpy()]))
     node_list = [{"name": n} for n in nodes]
-    links = cnt.rename(columns={src_col:'source', tgt_col:'target'})[['source','target','value']].to_dict(orient='records')
+    links = [{'source': s, 'target': t, 'value': v}
+             for s, t, v in zip(cnt[src_col].tolist(), cnt[tgt_col].tolist(), cnt['value'].tolist())]
     sankey = (
         Sankey()
         .add("", node_list, links, label_opts=opts.LabelOpts(position="right"))
@@ -242,17 +254,22 @@ def chart_top_orders(df):
 # 主流程
 
 def main():
-    sheets = load_sheets(EXCEL_PATH)
-    chart_type_dist(sheets['业务类型分布'])
-    chart_type_sub_dist(sheets['业务类型分布_细分'])
-    chart_region(sheets['区域分布'])
-    chart_amount_range(sheets['金额区间分布'])
-    chart_order_status(sheets['订单状态分布'])
-    chart_rating(sheets['评分区间分布'])
-    chart_late(sheets['迟到分布'])
-    chart_flow(sheets['流向统计'])
-    chart_type_compare(sheets['业务类型对比'])
-    chart_top_orders(sheets['明细全表'])
+    sheets = load_sheets_cached(EXCEL_PATH, os.path.getmtime(EXCEL_PATH))
+    # 各图表互不依赖且输出文件名不同，并行渲染
+    tasks = [
+        (chart_type_dist, sheets['业务类型分布']),
+        (chart_type_sub_dist, sheets['业务类型分布_细分']),
+        (chart_region, sheets['区域分布']),
+        (chart_amount_range, sheets['金额区间分布']),
+        (chart_order_status, sheets['订单状态分布']),
+        (chart_rating, sheets['评分区间分布']),
+        (chart_late, sheets['迟到分布']),
+        (chart_flow, sheets['流向统计']),
+        (chart_type_compare, sheets['业务类型对比']),
+        (chart_top_orders, sheets['明细全表']),
+    ]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(lambda p: p[0](p[1]), tasks))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 from pygwalker.api.streamlit import StreamlitRenderer
 import pandas as pd
 import streamlit as st
@@ -8,12 +10,27 @@ st.title("kabuda 数据可视化平台")
 EXCEL_PATH = r"E:\kabuda_data_analysis\司机业务信息库\司机业务_统计分析.xlsx"
 
 # 获取所有sheet名
-sheet_names = pd.ExcelFile(EXCEL_PATH).sheet_names
+sheet_names = pd.ExcelFile(EXCEL_PATH, engine="calamine").sheet_names
 sheet_choice = st.selectbox("请选择要分析的 sheet", sheet_names)
 
+# 启动时把每个 sheet 转成一份 Parquet，切换 sheet 时只读对应的 Parquet，不再解析 xlsx
+@st.cache_resource
+def ensure_parquet() -> Path:
+    path = Path(".cache")
+    path.mkdir(exist_ok=True)
+    for name, df in pd.read_excel(EXCEL_PATH, sheet_name=None, engine="calamine").items():
+        # object 列可能混有数字和文本，统一成 string 才能写入 Parquet
+        df = df.astype({c: "string" for c in df.select_dtypes("object").columns})
+        df.to_parquet(path / f"{name}.parquet")
+    return path
+
+@st.cache_data
+def load_sheet(sheet_name) -> pd.DataFrame:
+    return pd.read_parquet(ensure_parquet() / f"{sheet_name}.parquet")
+
 @st.cache_resource
 def get_pyg_renderer(sheet_name) -> "StreamlitRenderer":
-    df = pd.read_excel(EXCEL_PATH, sheet_name=sheet_name)
+    df = load_sheet(sheet_name)
     return StreamlitRenderer(df, spec=f"./gw_config_{sheet_name}.json", spec_io_mode="rw")
 
 renderer = get_pyg_renderer(sheet_choice)
@@ -18,6 +18,8 @@ driver_data_viz.py
 
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
+import joblib
 from pyecharts import options as opts
 from pyecharts.charts import Bar, Pie, Line, TreeMap, WordCloud
 
@@ -28,8 +30,15 @@ OUTPUT_DIR = r"E:\kabuda_data_analysis\司机信息数据库\visualization_chart
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 def load_sheets(path):
-    xls = pd.ExcelFile(path)
-    return {name: pd.read_excel(xls, name) for name in xls.sheet_names}
+    # sheet_name=None 一次解析返回 {sheet名: DataFrame}，calamine 为 Rust 实现的读取引擎
+    return pd.read_excel(path, sheet_name=None, engine="calamine")
+
+# 以 (路径, 修改时间) 为键缓存到磁盘，Excel 未变化时直接复用上次解析结果
+memory = joblib.Memory(os.path.join(OUTPUT_DIR, ".cache"), verbose=0)
+
+@memory.cache
+def load_sheets_cached(path, mtime):
+    return load_sheets(path)
 
 # 拆分多区域字段
 def explode_regions(df, col="活动地区"):
@@ -112,12 +121,14 @@ def chart_contact_complete(df_contact):
 
 # 6. 提交时间趋势
 def chart_submission_trend(df_main):
-    df = df_main.copy()
-    df['提交时间'] = pd.to_datetime(df['提交时间'])
-    ts = df.set_index('提交时间').resample('W').size()
+    # 直接在列上解析并按周计数，不复制整张表；补齐空周以保持与 resample('W') 一致
+    weeks = pd.to_datetime(df_main['提交时间'], errors="coerce").dropna().dt.to_period('W')
+    ts = weeks.value_counts()
+    if not ts.empty:
+        ts = ts.reindex(pd.period_range(ts.index.min(), ts.index.max(), freq='W'), fill_value=0)
     line = (
         Line()
-        .add_xaxis([t.strftime("%Y-%m-%d") for t in ts.index])
+        .add_xaxis(ts.index.end_time.strftime("%Y-%m-%d").tolist())
         .add_yaxis("新增司机数", ts.values, is_smooth=True)
         .set_global_opts(
             title_opts=opts.TitleOpts(title="提交时间趋势"),
@@ -145,8 +156,9 @@ def chart_order_pref(df_business):
 # 8. 补充信息词云
 def chart_extra_wordcloud(df_extra):
     text_cols = [c for c in df_extra.columns if df_extra[c].dtype == object]
-    texts = df_extra[text_cols].fillna("").agg(" ".join, axis=1)
-    all_text = " ".join(texts).split()
+    # 按行展平后一次性拼接，避免 axis=1 逐行调用 join
+    texts = df_extra[text_cols].fillna("").to_numpy().astype(str)
+    all_text = " ".join(texts.ravel()).split()
     wc = (
         WordCloud()
         .add("", [list(item) for item in pd.Series(all_text).value_counts().head(100).items()], word_size_range=[20, 100])
@@ -171,7 +183,7 @@ def chart_region_ranking(df_region):
 
 # 主函数
 def main():
-    sheets = load_sheets(EXCEL_PATH)
+    sheets = load_sheets_cached(EXCEL_PATH, os.path.getmtime(EXCEL_PATH))
     df_main     = sheets.get("司机全量档案", pd.DataFrame())
     df_business = sheets.get("业务信息_司机", pd.DataFrame())
     df_vehicle  = sheets.get("车辆信息_司机", pd.DataFrame())
@@ -179,15 +191,20 @@ def main():
     df_extra    = sheets.get("补充信息_司机", pd.DataFrame())
     df_region   = sheets.get("地区统计", pd.DataFrame())
 
-    chart_driver_level(df_main)
-    chart_region_treemap(df_main)
-    chart_profession_activity(df_business)
-    chart_vehicle_pie(df_vehicle)
-    chart_contact_complete(df_contact)
-    chart_submission_trend(df_main)
-    chart_order_pref(df_business)
-    chart_extra_wordcloud(df_extra)
-    chart_region_ranking(df_region)
+    # 各图表互不依赖且输出文件名不同，并行渲染
+    tasks = [
+        (chart_driver_level, df_main),
+        (chart_region_treemap, df_main),
+        (chart_profession_activity, df_business),
+        (chart_vehicle_pie, df_vehicle),
+        (chart_contact_complete, df_contact),
+        (chart_submission_trend, df_main),
+        (chart_order_pref, df_business),
+        (chart_extra_wordcloud, df_extra),
+        (chart_region_ranking, df_region),
+    ]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(lambda p: p[0](p[1]), tasks))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -8,15 +8,21 @@ driver_business_quickstats_mix_v2_optimized.py
 
 import os
 import re
+import asyncio
 import sys
 import json
+import hashlib
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
 import openai
-from openpyxl import load_workbook
-from openpyxl.worksheet.table import Table, TableStyleInfo
-from openpyxl.utils import get_column_letter
+from openai import AsyncOpenAI
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
 import logging
 
 # ===== 日志配置 =====
@@ -27,23 +33,89 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stderr)]
 )
 
+# 日期格式表与解析逻辑只在清洗脚本中定义一份，两处解析结果保持一致；
+# 放在日志配置之后导入，清洗脚本里的 basicConfig 不会覆盖本脚本的日志格式
+from data_clean_business import parse_dates
+
 # ===== 环境与Key =====
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 MODEL = "gpt-3.5-turbo"
 
+# ===== LLM 并发与限流 =====
+# 同时在途的请求数与每分钟 token 预算，按账号等级通过环境变量调整
+LLM_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "20"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "90000"))
+LLM_MAX_ATTEMPTS = 5
+# 可重试的错误：限流、连接失败（APITimeoutError 是 APIConnectionError 的子类）、服务端 5xx
+LLM_RETRY_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+class TokenBudgetTracker:
+    """滑动窗口 token 预算：记录最近 window 秒内发出的 (时间, token数)，超出预算时等待最早的记录过期"""
+
+    def __init__(self, tpm, window=60.0):
+        self.tpm = tpm
+        self.window = window
+        self.events = deque()
+        self.used = 0
+
+    async def acquire(self, tokens):
+        while True:
+            now = time.monotonic()
+            while self.events and now - self.events[0][0] >= self.window:
+                self.used -= self.events.popleft()[1]
+            # 单个请求超过整个预算时也放行，避免永久等待
+            if self.used + tokens <= self.tpm or not self.events:
+                self.events.append((now, tokens))
+                self.used += tokens
+                return
+            await asyncio.sleep(self.window - (now - self.events[0][0]))
+
+token_tracker = TokenBudgetTracker(OPENAI_TPM)
+
+def wait_retry_after(retry_state):
+    """优先按 429 响应里的 Retry-After 等待，没有时指数退避"""
+    exc = retry_state.outcome.exception()
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return wait_exponential(multiplier=1, min=1, max=30)(retry_state)
+
+async def chat_completion(client, sem, messages, max_tokens, **kwargs):
+    """受并发数和 token 预算约束的 chat.completions 调用，限流/连接/服务端错误自动重试"""
+    est_tokens = sum(len(m["content"]) for m in messages) + max_tokens
+    async with sem:
+        async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(LLM_RETRY_ERRORS),
+                wait=wait_retry_after, stop=stop_after_attempt(LLM_MAX_ATTEMPTS), reraise=True):
+            with attempt:
+                await token_tracker.acquire(est_tokens)
+                resp = await client.chat.completions.create(
+                    model=MODEL, messages=messages, temperature=0, max_tokens=max_tokens, **kwargs)
+    return resp
+
+def new_llm_client():
+    # 重试统一由 chat_completion 处理，关闭 SDK 自带重试避免叠加；
+    # 未配置 API Key 时构造即抛 OpenAIError，调用方需在 try 内创建并用 async with 关闭
+    return AsyncOpenAI(api_key=openai.api_key, max_retries=0)
+
 # ===== 路径配置 =====
 BASE_DIR = Path(r"E:\kabuda_data_analysis\司机业务信息库")
 CSV = BASE_DIR / "司机业务.csv"
 XLSX = BASE_DIR / "司机业务.xlsx"
 XLSX_OUT = BASE_DIR / "司机业务_统计分析.xlsx"
 CACHE_PATH = BASE_DIR / "area_normalize_cache.json"
+LLM_CACHE_PATH = BASE_DIR / "llm_cache.db"
 
 # ===== 数据读取 =====
+# 字符串列用 Arrow 存储（连续 UTF-8 缓冲区），后续 .str 正则直接在整列上运行；
+# 解析仍用 C 引擎：pyarrow 引擎会先推断数值类型再转字符串，"80" 会变成 "80.0"
 if CSV.exists():
-    df = pd.read_csv(CSV, dtype=str)
+    df = pd.read_csv(CSV, dtype="string[pyarrow]")
 elif XLSX.exists():
-    df = pd.read_excel(XLSX, sheet_name=0, dtype=str)
+    df = pd.read_excel(XLSX, sheet_name=0, dtype="string[pyarrow]")
 else:
     raise FileNotFoundError("未找到司机业务.csv或司机业务.xlsx")
 df = df.fillna("")
@@ -59,283 +131,420 @@ AREA_MAP = {
     "Mississauga": "密西沙加", "密西沙加": "密西沙加",
     "Etobicoke": "怡陶碧谷", "皮尔逊": "皮尔逊机场", "Pearson": "皮尔逊机场", "机场": "皮尔逊机场"
 }
+# 所有关键字编译成一个忽略大小写的正则，长关键字优先，一次扫描完成匹配
+_AREA_PATTERN = re.compile("|".join(re.escape(k) for k in sorted(AREA_MAP, key=len, reverse=True)), re.IGNORECASE)
+_AREA_LUT = {k.lower(): v for k, v in AREA_MAP.items()}
+
+# 旧版 JSON 缓存只读入作为初始值，新的 LLM 结果统一写入 SQLite 响应缓存
 if CACHE_PATH.exists():
     with open(CACHE_PATH, "r", encoding="utf-8") as f:
         area_cache = json.load(f)
 else:
     area_cache = {}
 
-def normalize_area(text, biz_type="未知", log_prefix=""):
-    """标准化单个地点字符串，自动日志输出"""
-    orig_text = text.strip()
-    # 先查映射
-    for k, v in AREA_MAP.items():
-        if k.lower() in orig_text.lower():
-            norm = v
-            break
-    else:
-        # 查缓存
-        if orig_text in area_cache:
-            norm = area_cache[orig_text]
+AREA_PROMPT = "请将下述地址归一化为GTA地区常见的行政区名（如多伦多、北约克、士嘉堡、万锦、列治文山、密西沙加、皮尔逊机场等），仅返回地名，不加其它：\n{}"
+
+# ===== LLM 响应缓存：区域归一与业务抽取共用一个 SQLite 键值表 =====
+def llm_cache_key(prompt, text):
+    """缓存键：模型、提示词与原文一起做 sha256，换模型或改提示词后自动失效"""
+    return hashlib.sha256(f"{MODEL}|{prompt}|{text}".encode("utf-8")).hexdigest()
+
+def open_llm_cache():
+    conn = sqlite3.connect(LLM_CACHE_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS responses(key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+def llm_cache_get(conn, key):
+    row = conn.execute("SELECT value FROM responses WHERE key=?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def llm_cache_put(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO responses(key, value) VALUES (?, ?)",
+                 (key, json.dumps(value, ensure_ascii=False)))
+
+def map_area(text):
+    """按 AREA_MAP 关键字匹配，未命中返回 None"""
+    m = _AREA_PATTERN.search(text)
+    return _AREA_LUT[m.group(0).lower()] if m else None
+
+async def llm_normalize_areas(texts):
+    """映射表未命中的地址先查响应缓存，其余并发调用LLM；结果写入 area_cache 和响应缓存"""
+    sem = asyncio.Semaphore(LLM_CONCURRENCY)
+    conn = open_llm_cache()
+    misses = []
+    for t in texts:
+        norm = llm_cache_get(conn, llm_cache_key(AREA_PROMPT, t))
+        if norm is None:
+            misses.append(t)
         else:
-            # LLM归一
-            try:
-                prompt = f"请将下述地址归一化为GTA地区常见的行政区名（如多伦多、北约克、士嘉堡、万锦、列治文山、密西沙加、皮尔逊机场等），仅返回地名，不加其它：\n{orig_text}"
-                resp = openai.chat.completions.create(
-                    model=MODEL,
-                    messages=[{"role": "system", "content": prompt}],
-                    temperature=0, max_tokens=8)
-                norm = resp.choices[0].message.content.strip().replace("。", "")
-                norm = norm if norm else orig_text
-                area_cache[orig_text] = norm
-                with open(CACHE_PATH, "w", encoding="utf-8") as f:
-                    json.dump(area_cache, f, ensure_ascii=False, indent=2)
-                logging.info(f"{log_prefix}LLM归一: 原始:「{orig_text}」→ 归一:「{norm}」| 业务类型: {biz_type}")
-            except Exception as e:
-                logging.error(f"{log_prefix}LLM归一失败: {e}")
-                norm = orig_text
-    if not log_prefix.startswith("[Flow]"):  # 避免流向日志太多
-        logging.info(f"{log_prefix}区域归一: 原始:「{orig_text}」→ 归一:「{norm}」| 业务类型: {biz_type}")
+            area_cache[t] = norm
+
+    async def one(client, orig_text):
+        try:
+            resp = await chat_completion(
+                client, sem,
+                [{"role": "system", "content": AREA_PROMPT.format(orig_text)}],
+                max_tokens=8)
+            norm = resp.choices[0].message.content.strip().replace("。", "")
+            norm = norm if norm else orig_text
+            area_cache[orig_text] = norm
+            llm_cache_put(conn, llm_cache_key(AREA_PROMPT, orig_text), norm)
+            logging.info(f"LLM归一: 原始:「{orig_text}」→ 归一:「{norm}」")
+        except Exception as e:
+            logging.error(f"LLM归一失败:「{orig_text}」{e}")
+
+    try:
+        async with new_llm_client() as client:
+            await asyncio.gather(*(one(client, t) for t in misses))
+    except openai.OpenAIError as e:
+        # 客户端无法创建（如未配置 API Key）时跳过LLM，这些地址保留原文
+        logging.error(f"LLM归一跳过，客户端不可用: {e}")
+    finally:
+        # 整批结束后提交一次，避免每条结果单独落盘
+        conn.commit()
+        conn.close()
+
+def normalize_area(text):
+    """标准化单个地点字符串；LLM 结果需先由 llm_normalize_areas 批量写入缓存"""
+    orig_text = text.strip()
+    # 先查映射，再查缓存；LLM 也失败的保留原文
+    norm = map_area(orig_text)
+    if norm is None:
+        norm = area_cache.get(orig_text, orig_text)
     return norm
 
 # ====== 结构化“订单概述”主要字段（原正则+LLM补齐）======
-def extract_info(text):
-    # 业务类型
-    if re.search(r"接机|送机", text):
-        type_ = "接送机"
-    elif re.search(r"包车|一日游|多日游|包日", text):
-        type_ = "包车"
-    elif re.search(r"跑腿|代买|代取|代送|代购", text):
-        type_ = "跑腿"
-    elif re.search(r"行李寄存|寄存", text):
-        type_ = "行李寄存"
-    elif re.search(r"搬家|搬运", text):
-        type_ = "搬家"
-    elif re.search(r"电话|叫醒|叫人", text):
-        type_ = "代办/其它"
-    else:
-        type_ = ""
-    # 区域判定（先粗取）
-    area_match = re.search(
-        r"多伦多|Toronto|皮尔逊|Markham|Richmond Hill|万锦|Scarborough|士嘉堡|约克|North York|Etobicoke|密西沙加|Mississauga|机场",
-        text, re.I)
-    area_ = area_match.group(0) if area_match else ""
-    # 金额
-    amount_match = re.search(r"[💰\$](\d+(\.\d+)?)", text)
-    amount = amount_match.group(1) if amount_match else ""
-    # 起点终点
-    addresses = re.findall(
-        r"从\s*([\u4e00-\u9fa5a-zA-Z0-9 ,#\-]+?)(?:到|—|-|－|——)\s*([\u4e00-\u9fa5a-zA-Z0-9 ,#\-]+)",
-        text)
-    if addresses:
-        start, end = addresses[0]
-    else:
-        start, end = "", ""
-    # 时间
-    time_match = re.search(
-        r"(\d{1,2}[:：]\d{2}\s*(?:AM|PM|am|pm)?)|(\d{1,2}点半?)|(\d{1,2}/\d{1,2}\s*\d{1,2}[:：]\d{2})|(?:上午|下午|中午)\s*\d{1,2}[:：]?\d{0,2}",
-        text)
-    time_ = time_match.group(0) if time_match else ""
-    return {
+# 业务类型按优先级排列，命中多个时取靠前的类型
+BIZ_TYPE_PATTERNS = [
+    ("接送机", re.compile(r"接机|送机")),
+    ("包车", re.compile(r"包车|一日游|多日游|包日")),
+    ("跑腿", re.compile(r"跑腿|代买|代取|代送|代购")),
+    ("行李寄存", re.compile(r"行李寄存|寄存")),
+    ("搬家", re.compile(r"搬家|搬运")),
+    ("代办/其它", re.compile(r"电话|叫醒|叫人")),
+]
+# 本地同义词词典：上面的正则都未命中时先查词典，仍未命中的才交给LLM；
+# 只收录明确的同义说法，取值限定为 BIZ_TYPE_PATTERNS 中已有的业务类型
+BIZ_LEXICON = {
+    "接送": "接送机", "接人": "接送机", "送人": "接送机", "接站": "接送机", "送站": "接送机",
+    "pick up": "接送机", "pickup": "接送机", "drop off": "接送机",
+    "包天": "包车", "包半天": "包车", "charter": "包车",
+    "帮买": "跑腿", "帮取": "跑腿", "帮送": "跑腿", "取件": "跑腿", "送件": "跑腿",
+    "存行李": "行李寄存",
+    "搬东西": "搬家", "搬箱": "搬家", "moving": "搬家",
+}
+# 英文词条要求前后不是英文字母，避免 "removing"、"chartered" 之类的子串误命中；
+# 不用 \b：中文在 Python re 里也算单词字符，"需要moving" 这类中英混写会匹配不到
+def _lexicon_term(key):
+    return rf"(?<![a-z]){re.escape(key)}(?![a-z])" if key.isascii() else re.escape(key)
+
+BIZ_LEXICON_RE = re.compile(
+    "(" + "|".join(_lexicon_term(k) for k in sorted(BIZ_LEXICON, key=len, reverse=True)) + ")", re.I)
+AREA_RE = re.compile(
+    r"(多伦多|Toronto|皮尔逊|Markham|Richmond Hill|万锦|Scarborough|士嘉堡|约克|North York|Etobicoke|密西沙加|Mississauga|机场)",
+    re.I)
+AMOUNT_RE = re.compile(r"[💰\$](\d+(?:\.\d+)?)")
+ADDRESS_RE = re.compile(
+    r"从\s*([\u4e00-\u9fa5a-zA-Z0-9 ,#\-]+?)(?:到|—|-|－|——)\s*([\u4e00-\u9fa5a-zA-Z0-9 ,#\-]+)")
+TIME_RE = re.compile(
+    r"(\d{1,2}[:：]\d{2}\s*(?:AM|PM|am|pm)?|\d{1,2}点半?|\d{1,2}/\d{1,2}\s*\d{1,2}[:：]\d{2}|(?:上午|下午|中午)\s*\d{1,2}[:：]?\d{0,2})")
+
+def extract_info(texts: pd.Series) -> pd.DataFrame:
+    """整列向量化提取订单概述字段，每个正则对整列只扫描一次"""
+    s = texts.fillna("")
+    conds = [s.str.contains(pat).to_numpy(dtype=bool) for _, pat in BIZ_TYPE_PATTERNS]
+    # 词典只对正则都未命中的行做提取
+    unmatched = s[~np.logical_or.reduce(conds)]
+    lexicon_type = (unmatched.str.extract(BIZ_LEXICON_RE, expand=False).str.lower().map(BIZ_LEXICON)
+                    .reindex(s.index).fillna(""))
+    type_ = np.select(conds, [label for label, _ in BIZ_TYPE_PATTERNS], default=lexicon_type)
+    addresses = s.str.extract(ADDRESS_RE)
+    return pd.DataFrame({
         "业务类型_struct": type_,
-        "区域_struct": area_,
-        "金额_struct": amount,
-        "起点": start,
-        "终点": end,
-        "时间_struct": time_
-    }
-
-extract_results = df["订单概述"].apply(extract_info).apply(pd.Series)
+        "区域_struct": s.str.extract(AREA_RE, expand=False),
+        "金额_struct": s.str.extract(AMOUNT_RE, expand=False),
+        "起点": addresses[0],
+        "终点": addresses[1],
+        "时间_struct": s.str.extract(TIME_RE, expand=False),
+    }, index=s.index).fillna("")
+
+extract_results = extract_info(df["订单概述"])
 to_llm_idx = extract_results[(extract_results["业务类型_struct"] == "") | (extract_results["区域_struct"] == "")].index
 llm_targets = df.loc[to_llm_idx, "订单概述"].tolist()
 
-def llm_extract(batch):
-    out = []
-    for text in batch:
-        logging.info(f"[LLM-Extract] 原文: {text}")
-        prompt = (
-            "你是业务归类助手，请仅输出如下格式：\n"
-            "业务类型: <类型>\n区域: <区域>\n"
-            "只允许返回两行，不加其它文字。"
-        )
+EXTRACT_PROMPT = (
+    "你是业务归类助手，请仅输出如下格式：\n"
+    "业务类型: <类型>\n区域: <区域>\n"
+    "只允许返回两行，不加其它文字。"
+)
+# 多条订单合并为一次请求，JSON 模式返回，摊薄每次调用的 HTTP 与 prefill 开销
+EXTRACT_BATCH_PROMPT = (
+    "你是业务归类助手。用户会给出若干行「编号: 订单概述」，请为每一行判断业务类型和区域，"
+    "以 JSON 对象输出：{\"items\": [{\"id\": 编号, \"业务类型\": \"<类型>\", \"区域\": \"<区域>\"}]}，"
+    "每个编号一条，不加其它文字。"
+)
+LLM_BATCH_SIZE = 20
+LLM_BATCH_MAX_TOKENS = 512
+LLM_TYPE_RE = re.compile(r"业务类型[:：]\s*(\S+)")
+LLM_AREA_RE = re.compile(r"区域[:：]\s*(\S+)")
+
+async def llm_extract(batch):
+    """并发调用LLM补齐业务类型/区域，经 chat_completion 限流与重试；
+    结果写入共用的响应缓存，重复运行时已见过的文本不再请求"""
+    sem = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def one(client, text):
+        """单条请求，返回 (业务类型, 区域)；调用失败或无返回时为 None"""
+        logging.debug("[LLM-Extract] 原文: %s", text)
         try:
-            resp = openai.chat.completions.create(
-                model=MODEL,
-                messages=[
-                    {"role": "system", "content": prompt},
+            resp = await chat_completion(
+                client, sem,
+                [
+                    {"role": "system", "content": EXTRACT_PROMPT},
                     {"role": "user", "content": text},
                 ],
-                temperature=0.0, max_tokens=30,
-            )
+                max_tokens=30)
             ans = resp.choices[0].message.content.strip()
-            t = re.search(r"业务类型[:：]\s*(\S+)", ans)
-            a = re.search(r"区域[:：]\s*(\S+)", ans)
-            biz = t.group(1) if t else ""
-            area = a.group(1) if a else ""
-            logging.info(f"[LLM-Extract] 归一结果: 业务类型: {biz}, 区域: {area}")
-            out.append({
-                "业务类型_struct": biz,
-                "区域_struct": area
-            })
         except Exception as e:
             logging.error(f"[LLM-Extract] call failed: {e}")
-            out.append({"业务类型_struct": "", "区域_struct": ""})
-    return pd.DataFrame(out)
+            return None
+        if not ans:
+            return None
+        t = LLM_TYPE_RE.search(ans)
+        a = LLM_AREA_RE.search(ans)
+        return (t.group(1) if t else "", a.group(1) if a else "")
+
+    async def one_batch(client, texts):
+        """一次请求处理一批文本，按编号对回结果；批量结果里缺失的编号逐条重试。
+        返回每条的 (产生结果的提示词, 结果)，结果写缓存时按该提示词作键"""
+        lines = "\n".join(f"{i}: {' '.join(t.split())}" for i, t in enumerate(texts))
+        by_id = {}
+        try:
+            resp = await chat_completion(
+                client, sem,
+                [
+                    {"role": "system", "content": EXTRACT_BATCH_PROMPT},
+                    {"role": "user", "content": lines},
+                ],
+                max_tokens=LLM_BATCH_MAX_TOKENS,
+                response_format={"type": "json_object"})
+            items = json.loads(resp.choices[0].message.content).get("items", [])
+        except Exception as e:
+            logging.error(f"[LLM-Extract] batch call failed: {e}")
+            items = []
+        # 逐条解析：个别条目缺编号或格式不对时只丢弃该条，其余编号照常采用
+        for item in items if isinstance(items, list) else []:
+            try:
+                i = int(item["id"])
+                ans = (str(item.get("业务类型", "")).strip(), str(item.get("区域", "")).strip())
+            except (KeyError, TypeError, ValueError, AttributeError):
+                logging.debug("[LLM-Extract] 忽略无法解析的批量条目: %r", item)
+                continue
+            if 0 <= i < len(texts):
+                by_id[i] = ans
+        out = [(EXTRACT_BATCH_PROMPT, by_id.get(i)) for i in range(len(texts))]
+        missing = [i for i, (_, r) in enumerate(out) if r is None]
+        if missing:
+            logging.info(f"[LLM-Extract] 批量结果缺少 {len(missing)} 条，逐条重试")
+            for i, r in zip(missing, await asyncio.gather(*(one(client, texts[i]) for i in missing))):
+                out[i] = (EXTRACT_PROMPT, r)
+        return out
+
+    # 批量与单条结果分别以各自的提示词作键，改任一提示词只让它产生的缓存失效
+    conn = open_llm_cache()
+    results = {}
+    misses = []
+    for text in dict.fromkeys(batch):
+        for prompt in (EXTRACT_BATCH_PROMPT, EXTRACT_PROMPT):
+            cached = llm_cache_get(conn, llm_cache_key(prompt, text))
+            if cached is not None:
+                results[text] = tuple(cached)
+                break
+        else:
+            misses.append(text)
+    logging.info(f"[LLM-Extract] 缓存命中 {len(results)} 条，需调用LLM {len(misses)} 条")
+
+    batches = [misses[i:i + LLM_BATCH_SIZE] for i in range(0, len(misses), LLM_BATCH_SIZE)]
+    answers = [(None, None)] * len(misses)
+    if batches:
+        try:
+            async with new_llm_client() as client:
+                answers = [r for rs in await asyncio.gather(*(one_batch(client, b) for b in batches)) for r in rs]
+        except openai.OpenAIError as e:
+            # 客户端无法创建（如未配置 API Key）时跳过LLM，未命中缓存的文本结果留空
+            logging.error(f"[LLM-Extract] 跳过LLM，客户端不可用: {e}")
+    for text, (prompt, ans) in zip(misses, answers):
+        if ans is None:
+            results[text] = ("", "")
+            continue
+        results[text] = ans
+        logging.debug("[LLM-Extract] 归一结果: 业务类型: %s, 区域: %s", *ans)
+        llm_cache_put(conn, llm_cache_key(prompt, text), list(ans))
+    conn.commit()
+    conn.close()
+    return pd.DataFrame([results[t] for t in batch], columns=["业务类型_struct", "区域_struct"])
 
 if llm_targets:
-    batches = [llm_targets[i:i+10] for i in range(0, len(llm_targets), 10)]
-    llm_out = pd.concat([llm_extract(b) for b in batches], ignore_index=True)
-    extract_results.loc[to_llm_idx, ["业务类型_struct", "区域_struct"]] = llm_out.values
+    # 相同的订单概述只请求一次，结果按原文广播回各行；空文本不请求
+    unique_targets = list(dict.fromkeys(t for t in llm_targets if t.strip()))
+    llm_out = asyncio.run(llm_extract(unique_targets))
+    lookup = dict(zip(unique_targets, llm_out.itertuples(index=False, name=None)))
+    extract_results.loc[to_llm_idx, ["业务类型_struct", "区域_struct"]] = [
+        lookup.get(t, ("", "")) for t in llm_targets
+    ]
 
 # 合并回df
 for col in extract_results.columns:
     df[col] = extract_results[col]
 
-# ===== 区域归一：应用于所有相关字段 =====
-df["区域归一"] = [
-    normalize_area(area, biz_type=biz, log_prefix="[区域分布] ")
-    for area, biz in zip(df["区域_struct"], df["业务类型_struct"])
-]
-
-# ====== 起点/终点归一（流向用）======
-df["起点归一"] = [
-    normalize_area(addr, biz_type=biz, log_prefix="[Flow-起点] ")
-    for addr, biz in zip(df["起点"], df["业务类型_struct"])
-]
-df["终点归一"] = [
-    normalize_area(addr, biz_type=biz, log_prefix="[Flow-终点] ")
-    for addr, biz in zip(df["终点"], df["业务类型_struct"])
-]
+# ===== 区域归一：三列地址去重后每个值只解析一次 =====
+AREA_COLS = {"区域_struct": "区域归一", "起点": "起点归一", "终点": "终点归一"}
+unique_areas = pd.unique(pd.concat([df[c] for c in AREA_COLS], ignore_index=True))
+
+# 映射表和缓存都未命中的地址先并发走LLM
+area_targets = list(dict.fromkeys(
+    t for t in (a.strip() for a in unique_areas)
+    if t and map_area(t) is None and t not in area_cache
+))
+if area_targets:
+    asyncio.run(llm_normalize_areas(area_targets))
+
+# 每个去重后的地址只解析、只记一次日志，再按原值广播回各行
+resolved = {a: normalize_area(a) for a in unique_areas}
+for orig, norm in resolved.items():
+    logging.info(f"区域归一: 原始:「{orig.strip()}」→ 归一:「{norm}」")
+for src_col, dst_col in AREA_COLS.items():
+    df[dst_col] = df[src_col].map(resolved)
 
 # ========== 字段融合 ==========
 
-df["业务类型_结构化"] = df["业务类型_struct"]
 if "订单类型" in df.columns:
-    df.loc[df["业务类型_结构化"] == "", "业务类型_结构化"] = df["订单类型"]
+    df["业务类型_结构化"] = np.where(df["业务类型_struct"].eq(""), df["订单类型"], df["业务类型_struct"])
+else:
+    df["业务类型_结构化"] = df["业务类型_struct"]
 df["业务类型_大类"] = df.get("订单类型", "")
 
 # ========== 统计分析Sheet生成 ==========
 
-def try_to_float(x):
-    try:
-        return float(x)
-    except:
-        return None
-
-report_tables = {}
-
-# 1. 业务类型分布_细分
-vc = df["业务类型_结构化"].value_counts(dropna=False).reset_index()
-vc.columns = ["业务类型_细分", "数量"]
-report_tables["业务类型分布_细分"] = vc
-
-# 2. 业务类型分布
-vc = df["业务类型_大类"].value_counts(dropna=False).reset_index()
-vc.columns = ["业务类型", "数量"]
-report_tables["业务类型分布"] = vc
-
-# 3. 区域分布（归一化后）
-vc = df["区域归一"].value_counts(dropna=False).reset_index()
-vc.columns = ["区域", "数量"]
-report_tables["区域分布"] = vc
-
-# 4. 金额区间分布
-for col in ["金额_struct", "订单金额", "金额"]:
-    if col in df.columns:
-        amount = df[col].apply(try_to_float)
-        bins = [0, 50, 100, 200, 500, 1000, float('inf')]
-        labels = ["0-50", "50-100", "100-200", "200-500", "500-1000", "1000+"]
-        cut = pd.cut(amount, bins=bins, labels=labels, right=False)
-        vc = cut.value_counts(sort=False).reset_index()
-        vc.columns = ["区间", "数量"]
-        report_tables["金额区间分布"] = vc
-        break
-
-# 5. 订单状态分布
-for col in ["订单状态"]:
-    if col in df.columns:
-        vc = df[col].value_counts(dropna=False).reset_index()
-        vc.columns = [col, "数量"]
-        report_tables["订单状态分布"] = vc
-        break
-
-# 6. 评分区间分布
-for col in ["评分", "客户评分"]:
-    if col in df.columns:
-        score = df[col].apply(try_to_float)
-        bins = [0, 3, 5, 8, 10]
-        labels = ["0-3", "3-5", "5-8", "8-10"]
-        cut = pd.cut(score, bins=bins, labels=labels, right=False, include_lowest=True)
-        vc = cut.value_counts(sort=False).reset_index()
-        vc.columns = ["区间", "数量"]
-        report_tables["评分区间分布"] = vc
-        break
-
-# 7. 迟到分布
-for col in ["是否迟到", "迟到", "迟到次数"]:
-    if col in df.columns:
-        vc = df[col].value_counts(dropna=False).reset_index()
-        vc.columns = [col, "数量"]
-        report_tables["迟到分布"] = vc
-        break
-
-# 8. 按月趋势
-for col in ["下单时间", "订单日期", "创建时间"]:
-    if col in df.columns:
-        dates = pd.to_datetime(df[col], errors="coerce")
-        monthly = dates.dt.to_period("M").value_counts().sort_index().reset_index()
-        monthly.columns = ["月份", "订单数"]
-        report_tables["每月订单趋势"] = monthly
-        break
-
-# 9. 司机分布
-for col in ["司机", "司机姓名", "司机ID"]:
-    if col in df.columns:
-        vc = df[col].value_counts(dropna=False).reset_index()
-        vc.columns = [col, "数量"]
-        report_tables["司机分布"] = vc
-        break
-
-# 10. 起点终点流向分析（归一化后）
-flow = df.groupby(["起点归一", "终点归一"]).size().reset_index(name="订单数").sort_values("订单数", ascending=False)
-report_tables["流向统计"] = flow
-
-# 11. 业务类型对比 (始终生成，如果无差异则为空表)
-if "订单类型" in df.columns:
-    diff_mask = (df["订单类型"] != df["业务类型_结构化"]) & (df["业务类型_结构化"] != "")
-    df_diff = df.loc[diff_mask, ["订单概述", "业务类型_结构化", "业务类型_大类"]].rename(
-        columns={"业务类型_结构化": "结构化业务类型", "业务类型_大类": "订单类型"}
-    )
-else:
-    df_diff = pd.DataFrame(columns=["订单概述", "结构化业务类型", "订单类型"])
-report_tables["业务类型对比"] = df_diff
+def bin_counts(values: pd.Series, bins, labels) -> pd.DataFrame:
+    """左闭右开分箱计数，等价 pd.cut(right=False).value_counts(sort=False)；
+    用 searchsorted 直接求箱号，无法转为数值或落在区间外的值不计入"""
+    arr = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    idx = np.searchsorted(bins, arr, side="right") - 1
+    valid = (idx >= 0) & (idx < len(labels))
+    counts = np.bincount(idx[valid], minlength=len(labels))
+    return pd.DataFrame({"区间": labels, "数量": counts})
+
+# 各统计表由 REPORTS 声明式描述：候选列取第一个存在的；有 bins 的做分箱计数，
+# 有 build 的调用专用函数，其余做 value_counts。列都不存在时跳过该表
+def count_table(col, header):
+    vc = df[col].value_counts(dropna=False).reset_index()
+    vc.columns = [header, "数量"]
+    return vc
+
+def monthly_table(col):
+    dates = parse_dates(df[col])
+    monthly = dates.dt.to_period("M").value_counts().sort_index().reset_index()
+    monthly.columns = ["月份", "订单数"]
+    return monthly
+
+def flow_table(_):
+    # 转成分类后按整数编码计数，value_counts 已按订单数降序排列
+    return (df[["起点归一", "终点归一"]].astype("category")
+            .value_counts().reset_index(name="订单数"))
+
+def type_compare_table(_):
+    # 始终生成，如果无差异则为空表
+    if "订单类型" in df.columns:
+        diff_mask = (df["订单类型"] != df["业务类型_结构化"]) & (df["业务类型_结构化"] != "")
+        return df.loc[diff_mask, ["订单概述", "业务类型_结构化", "业务类型_大类"]].rename(
+            columns={"业务类型_结构化": "结构化业务类型", "业务类型_大类": "订单类型"}
+        )
+    return pd.DataFrame(columns=["订单概述", "结构化业务类型", "订单类型"])
+
+REPORTS = [
+    {"name": "业务类型分布_细分", "cols": ["业务类型_结构化"], "header": "业务类型_细分"},
+    {"name": "业务类型分布", "cols": ["业务类型_大类"], "header": "业务类型"},
+    {"name": "区域分布", "cols": ["区域归一"], "header": "区域"},
+    {"name": "金额区间分布", "cols": ["金额_struct", "订单金额", "金额"],
+     "bins": [0, 50, 100, 200, 500, 1000, np.inf],
+     "labels": ["0-50", "50-100", "100-200", "200-500", "500-1000", "1000+"]},
+    {"name": "订单状态分布", "cols": ["订单状态"]},
+    {"name": "评分区间分布", "cols": ["评分", "客户评分"],
+     "bins": [0, 3, 5, 8, 10], "labels": ["0-3", "3-5", "5-8", "8-10"]},
+    {"name": "迟到分布", "cols": ["是否迟到", "迟到", "迟到次数"]},
+    {"name": "每月订单趋势", "cols": ["下单时间", "订单日期", "创建时间"], "build": monthly_table},
+    {"name": "司机分布", "cols": ["司机", "司机姓名", "司机ID"]},
+    {"name": "流向统计", "cols": ["起点归一"], "build": flow_table},
+    {"name": "业务类型对比", "cols": None, "build": type_compare_table},
+]
+present_cols = set(df.columns)
+
+def run_report(spec):
+    """按声明生成一张统计表，返回 (sheet名, 表)；候选列都不存在时返回 None"""
+    col = None
+    if spec["cols"] is not None:
+        col = next((c for c in spec["cols"] if c in present_cols), None)
+        if col is None:
+            return None
+    if "build" in spec:
+        table = spec["build"](col)
+    elif "bins" in spec:
+        table = bin_counts(df[col], np.array(spec["bins"]), spec["labels"])
+    else:
+        table = count_table(col, spec.get("header", col))
+    return spec["name"], table
+
+# pandas 的计数/分组内核大多释放 GIL，线程池即可并行；map 保持顺序，sheet 顺序不变
+with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+    report_tables = dict(r for r in ex.map(run_report, REPORTS) if r is not None)
 
 # 12. 明细全表
 report_tables["明细全表"] = df
 
 # ===== 输出Excel，多sheet自动列宽和表格样式 =====
-with pd.ExcelWriter(XLSX_OUT, engine="openpyxl", mode="w") as writer:
+def column_widths(table: pd.DataFrame) -> list:
+    """按 DataFrame 内容（含表头）计算每列宽度，写入时直接设置，无需回读 Excel"""
+    widths = []
+    for i, col in enumerate(table.columns):
+        values = table.iloc[:, i]
+        lengths = values.astype(str).str.len().where(values.notna(), 0)
+        widths.append(max(len(str(col)), lengths.max() if len(lengths) else 0) + 2)
+    return widths
+
+def style_sheet(ws, name: str, table: pd.DataFrame):
+    """在 xlsxwriter worksheet 上设置列宽，并为统计表套用 Table 样式"""
+    for i, width in enumerate(column_widths(table)):
+        ws.set_column(i, i, width)
+    end_row = len(table)
+    end_col = len(table.columns) - 1
+    if name != "明细全表" and end_row > 0 and end_col >= 0:
+        ws.add_table(0, 0, end_row, end_col, {
+            "name": f"Table_{ws.name.replace(' ', '_')}",
+            "style": "Table Style Medium 9",
+            "columns": [{"header": str(c)} for c in table.columns],
+        })
+
+def write_rows(writer, sheet_name: str, table: pd.DataFrame):
+    """按行 write_row 写出大表，跳过 to_excel 为每个单元格构造 ExcelCell 和样式的开销"""
+    ws = writer.book.add_worksheet(sheet_name)
+    header_fmt = writer.book.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    ws.write_row(0, 0, [str(c) for c in table.columns], header_fmt)
+    # 逐行把缺失值换成 None（写为空单元格），不为整表再生成一份 object 副本
+    for i, row in enumerate(table.itertuples(index=False, name=None), start=1):
+        ws.write_row(i, 0, [None if pd.isna(v) else v for v in row])
+    return ws
+
+# 不启用 constant_memory：统计表经 to_excel 按列写入，且该模式不支持 add_table；
+# 关闭 strings_to_urls：明细里的链接按普通文本写入，避免超出单表 65530 个超链接或超长 URL 时单元格被留空
+with pd.ExcelWriter(XLSX_OUT, engine="xlsxwriter",
+                    engine_kwargs={"options": {"strings_to_urls": False}}) as writer:
     for name, table in report_tables.items():
-        table.to_excel(writer, index=False, sheet_name=name[:31])
-
-def auto_adjust_column_width_and_style(xlsx_path: Path):
-    wb = load_workbook(xlsx_path)
-    for ws in wb.worksheets:
-        for col in ws.columns:
-            max_length = max(len(str(cell.value or "")) for cell in col)
-            col_letter = get_column_letter(col[0].column)
-            ws.column_dimensions[col_letter].width = max_length + 2
-        if ws.title != "明细全表":
-            end_row = ws.max_row
-            end_col = ws.max_column
-            if end_row > 1 and end_col > 0:
-                tab = Table(displayName=f"Table_{ws.title.replace(' ', '_')}",
-                            ref=f"A1:{get_column_letter(end_col)}{end_row}")
-                style = TableStyleInfo(name="TableStyleMedium9", showFirstColumn=False,
-                                      showLastColumn=False, showRowStripes=True, showColumnStripes=False)
-                tab.tableStyleInfo = style
-                ws.add_table(tab)
-    wb.save(xlsx_path)
-
-auto_adjust_column_width_and_style(XLSX_OUT)
+        if name == "明细全表":
+            ws = write_rows(writer, name[:31], table)
+        else:
+            table.to_excel(writer, index=False, sheet_name=name[:31])
+            ws = writer.sheets[name[:31]]
+        style_sheet(ws, name, table)
+
 logging.info("✅ 所有统计完成，分析Excel已输出到司机业务_统计分析.xlsx！")
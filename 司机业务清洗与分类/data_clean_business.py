@@ -19,17 +19,26 @@ from typing import Optional
 import chardet
 import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.worksheet.table import Table, TableStyleInfo
-from openpyxl.utils import get_column_letter
-import re
+# ========== 正则（模块级预编译，各清洗函数共用） ==========
+# 注：.str.replace 传入 Pattern 对象会在 Arrow 列上退回逐行 Python 替换，因此替换处使用 .pattern；
+# Arrow 列上的正则由 RE2 执行，\d/\w 只匹配 ASCII，依赖 Unicode 语义的校验需在 object 列上进行
+_SCORE_RE = re.compile(r"^\d+(\.\d+)?$")
+_DIGITS_RE = re.compile(r"\D")
+_PHONE_RE = re.compile(r"^1\d{10}$|^6\d{9}$")
+_EMAIL_RE = re.compile(r"^[\w\.-]+@[\w\.-]+\.\w+$")
+_AREA_OTHER_RE = re.compile(r"其他\(请说明地区\)")
+_JOB_SEP_RE = re.compile(r"[，、]")
+_NON_NUMERIC_RE = re.compile(r"[^\d\.]")
+_HAN_RE = re.compile("[\u4e00-\u9fa5]")
+
 #客户评分列清洗函数，如果客户评分列存在非数字或空白内容，则替换为0
 def clean_score_column(df: pd.DataFrame, col: str = "客户评分") -> pd.DataFrame:
     """
     把客户评分列所有非数字或空白内容都替换为0，支持小数。
     """
     if col in df.columns:
-        df[col] = df[col].apply(lambda x: x if re.match(r"^\d+(\.\d+)?$", str(x)) else "0")
+        s = df[col].astype(str)
+        df[col] = s.where(s.str.match(_SCORE_RE), "0")
     return df
 
 # ========== 配置 ==========
@@ -47,9 +56,10 @@ logging.basicConfig(
 )
 
 # ========== 1. 读取原始档案 ==========
-def detect_encoding(fp: Path) -> str:
+def detect_encoding(fp: Path, sample_size: int = 64 * 1024) -> str:
+    # 只取文件头部样本做检测，大文件无需整份读入内存
     with open(fp, "rb") as f:
-        return chardet.detect(f.read())["encoding"] or "utf-8"
+        return chardet.detect(f.read(sample_size))["encoding"] or "utf-8"
 
 def load_raw(fp: Path) -> pd.DataFrame:
     ext = fp.suffix.lower()
@@ -57,9 +67,10 @@ def load_raw(fp: Path) -> pd.DataFrame:
     if ext == ".csv":
         enc = detect_encoding(fp)
         logging.info("检测到编码: %s", enc)
-        return pd.read_csv(fp, encoding=enc, dtype=str)
+        # Arrow 字符串列：连续内存存储，后续 .str 操作走 pyarrow.compute
+        return pd.read_csv(fp, encoding=enc, dtype="string[pyarrow]").fillna("")
     elif ext in (".xls", ".xlsx"):
-        return pd.read_excel(fp, dtype=str, engine="openpyxl")
+        return pd.read_excel(fp, dtype="string[pyarrow]", engine="openpyxl").fillna("")
     else:
         raise ValueError(f"不支持的文件类型: {ext}")
 
@@ -69,7 +80,7 @@ def normalize_na(df: pd.DataFrame) -> pd.DataFrame:
     for col in df.columns:
         df[col] = (
             df[col]
-            .astype(str)
+            .astype("string[pyarrow]")
             .replace(["nan", "None", "NaN", ""], "缺失")
             .str.strip()
             .fillna("缺失")
@@ -78,28 +89,44 @@ def normalize_na(df: pd.DataFrame) -> pd.DataFrame:
 
 def clean_contact(df: pd.DataFrame) -> pd.DataFrame:
     # 如果表里没有手机号/邮箱/微信号等列，则跳过
+    # 手机号/邮箱在 object 列上用 Python re 校验：Arrow 列的正则走 RE2，其 \d/\w 只匹配 ASCII，
+    # 会把全角数字、中文邮箱等原本合法的值判为“缺失”
     if "手机号" in df.columns:
-        phone_re = re.compile(r"^1\d{10}$|^6\d{9}$")
-        df["手机号"] = (
-            df["手机号"].astype(str)
-            .apply(lambda x: re.sub(r"\D", "", x))
-            .apply(lambda x: x if phone_re.match(x) else "缺失")
-        )
+        digits = df["手机号"].astype(object).str.replace(_DIGITS_RE, "", regex=True)
+        df["手机号"] = digits.where(digits.str.match(_PHONE_RE), "缺失").astype("string[pyarrow]")
     if "邮箱" in df.columns:
-        df["邮箱"] = df["邮箱"].apply(
-            lambda x: x if re.match(r"^[\w\.-]+@[\w\.-]+\.\w+$", str(x)) else "缺失"
-        )
+        email = df["邮箱"].astype(object)
+        df["邮箱"] = email.where(email.str.match(_EMAIL_RE), "缺失").astype("string[pyarrow]")
     if "微信号" in df.columns:
-        df["微信号"] = df["微信号"].apply(
-            lambda x: x if 3 < len(str(x)) < 50 and x != "缺失" else "缺失"
-        )
+        wx_len = df["微信号"].str.len()
+        df["微信号"] = df["微信号"].where(wx_len.gt(3) & wx_len.lt(50) & df["微信号"].ne("缺失"), "缺失")
     return df
 
+# 常见日期格式：先在样本上选出命中最多的格式，再按固定格式整列解析，避免逐值推断
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d",
+]
+
+def parse_dates(s: pd.Series, sample_size: int = 1000) -> pd.Series:
+    filled = s.notna() & (s.astype(str).str.strip() != "")
+    sample = s[filled].head(sample_size)
+    hits = {fmt: pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum() for fmt in DATE_FORMATS}
+    best = max(hits, key=hits.get) if len(sample) else None
+    if best is None or hits[best] == 0:
+        return pd.to_datetime(s, errors="coerce")
+    parsed = pd.to_datetime(s, format=best, errors="coerce", cache=True)
+    # 与主格式不符的非空值逐个推断格式补回，避免少数格式的行变成 NaT
+    rest = parsed.isna() & filled
+    if rest.any():
+        parsed[rest] = pd.to_datetime(s[rest], format="mixed", errors="coerce")
+    return parsed
+
 def clean_dates(df: pd.DataFrame) -> pd.DataFrame:
     # 对所有看起来像“时间”的列尝试转换
     for col in ["订单时间", "实际操作时间"]:
         if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
+            df[col] = parse_dates(df[col])
     return df
 
 def clean_area_other(df: pd.DataFrame) -> pd.DataFrame:
@@ -107,7 +134,7 @@ def clean_area_other(df: pd.DataFrame) -> pd.DataFrame:
         df["活动地区"] = (
             df["活动地区"]
             .astype(str)
-            .str.replace(r"其他\(请说明地区\)", "", regex=True)
+            .str.replace(_AREA_OTHER_RE.pattern, "", regex=True)
             .str.strip()
             .replace({"": "缺失"})
         )
@@ -116,22 +143,17 @@ def clean_area_other(df: pd.DataFrame) -> pd.DataFrame:
 def clean_job_time(df: pd.DataFrame) -> pd.DataFrame:
     if "接单时间" in df.columns:
         df["接单时间"] = (
-            df["接单时间"].astype(str)
-            .str.replace(r"[，、]", ",", regex=True)
-            .apply(lambda x: "缺失" if x == "缺失" else x.split(",")[0])
+            df["接单时间"]
+            .str.replace(_JOB_SEP_RE.pattern, ",", regex=True)
+            .str.split(",", n=1).str[0]
         )
     return df
 
 def clean_vehicle(df: pd.DataFrame) -> pd.DataFrame:
     # 仅处理“车辆信息”“驾照”列，若存在
-    if "车辆信息" in df.columns:
-        df["车辆信息"] = df["车辆信息"].astype(str).apply(
-            lambda x: "缺失" if x.strip() == "" else x
-        )
-    if "驾照" in df.columns:
-        df["驾照"] = df["驾照"].astype(str).apply(
-            lambda x: "缺失" if x.strip() == "" else x
-        )
+    for col in ("车辆信息", "驾照"):
+        if col in df.columns:
+            df[col] = df[col].mask(df[col].str.strip().eq(""), "缺失")
     return df
 
 def derive_tags(df: pd.DataFrame) -> pd.DataFrame:
@@ -148,8 +170,8 @@ def clean_late_column(df: pd.DataFrame, col: str = "是否迟到") -> pd.DataFra
     return df
 
 def run_basic_pipeline(raw: pd.DataFrame) -> pd.DataFrame:
-    df = raw.copy()
-    df = normalize_na(df)
+    # 各步骤直接在传入的表上逐列改写，调用方不再复用原始表，无需整表复制
+    df = normalize_na(raw)
     df = clean_score_column(df)
     df = clean_late_column(df)
 
@@ -162,6 +184,13 @@ def run_basic_pipeline(raw: pd.DataFrame) -> pd.DataFrame:
     return df
 
 # ========== 3. 核心业务表异常值清洗函数 ==========
+def to_valid_category(s: pd.Series, valid, fallback: str) -> pd.Series:
+    """
+    转成以合法取值为类别的 Categorical：空值和非法值在构造时即为 NaN，统一填为 fallback。
+    """
+    categories = list(dict.fromkeys([*valid, fallback]))
+    return pd.Series(pd.Categorical(s, categories=categories), index=s.index).fillna(fallback)
+
 def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
     """
     对业务核心表做异常值处理，返回清洗后的 DataFrame。
@@ -172,8 +201,6 @@ def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
       - 文本/标识字段异常标注
     """
 
-    df = df.copy()
-
     # --- 1. 日期字段处理 --- #
     if "订单时间" in df.columns:
         #     df["订单时间_原"] = df["订单时间"]
@@ -196,7 +223,7 @@ def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
     # --- 2. 数值字段处理 --- #
     def to_float(col: str) -> pd.Series:
         if col in df.columns:
-            return pd.to_numeric(df[col].astype(str).str.replace(r"[^\d\.]", "", regex=True), errors="coerce")
+            return pd.to_numeric(df[col].astype(str).str.replace(_NON_NUMERIC_RE.pattern, "", regex=True), errors="coerce")
         return pd.Series(dtype="float64")
 
     if "客户评分" in df.columns:
@@ -241,8 +268,7 @@ def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
         '跑腿','闪送','小程序接送机','其他'
     ]
     # 用“缺失”填空，并把非列表内值也当成“其他”
-    df['订单类型'] = df['订单类型'].fillna('缺失').replace({'': '缺失'})
-    df.loc[~df['订单类型'].isin(raw_types), '订单类型'] = '其他'
+    df['订单类型'] = to_valid_category(df['订单类型'], raw_types, '其他')
 
     # —— 2. 定义归类映射 ——
     mapping = {
@@ -257,6 +283,7 @@ def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
         '其他':     '其他',
         '缺失':     '缺失'
     }
+    # 分类列上的 map 只作用于类别本身，与行数无关
     df['订单类型'] = df['订单类型'].map(mapping)
 
 
@@ -264,27 +291,22 @@ def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
 
     if "支付方式" in df.columns:
         valid_pay = {"微信", "支付宝", "现金"}
-        df["支付方式"] = df["支付方式"].fillna("缺失").replace({"": "缺失"})
-        df.loc[~df["支付方式"].isin(valid_pay), "支付方式"] = "其他"
+        df["支付方式"] = to_valid_category(df["支付方式"], valid_pay, "其他")
 
     if "支付状态" in df.columns:
         valid_status = {"已支付", "未支付", "待支付"}
-        df["支付状态"] = df["支付状态"].fillna("缺失").replace({"": "缺失"})
-        df.loc[~df["支付状态"].isin(valid_status), "支付状态"] = "缺失"
+        df["支付状态"] = to_valid_category(df["支付状态"], valid_status, "缺失")
 
     if "发票状态" in df.columns:
         valid_inv = {"已开票", "未开票"}
-        df["发票状态"] = df["发票状态"].fillna("缺失").replace({"": "缺失"})
-        df.loc[~df["发票状态"].isin(valid_inv), "发票状态"] = "缺失"
+        df["发票状态"] = to_valid_category(df["发票状态"], valid_inv, "缺失")
 
     if "订单状态" in df.columns:
         valid_ord = {"已完成", "进行中", "已取消", "已过期"}
-        df["订单状态"] = df["订单状态"].fillna("缺失").replace({"": "缺失"})
-        df.loc[~df["订单状态"].isin(valid_ord), "订单状态"] = "缺失"
+        df["订单状态"] = to_valid_category(df["订单状态"], valid_ord, "缺失")
 
     if "是否已结算" in df.columns:
-        df["是否已结算"] = df["是否已结算"].fillna("缺失").replace({"": "缺失"})
-        df.loc[~df["是否已结算"].isin({"是", "否"}), "是否已结算"] = "缺失"
+        df["是否已结算"] = to_valid_category(df["是否已结算"], {"是", "否"}, "缺失")
 
     # --- 4. 文本/标识字段校验 --- #
     # ———— 订单编号处理 ————
@@ -306,7 +328,7 @@ def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
             df["客户微信号"].isna()  # NaN
             | (df["客户微信号"] == "")  # 空字符串
             | df["客户微信号"]
-                .str.contains(r'[\u4e00-\u9fa5]', regex=True, na=False)  # 包含汉字
+                .str.contains(_HAN_RE, na=False)  # 包含汉字
         )
         df.loc[mask, "客户微信号"] = "缺失"
 
@@ -332,20 +354,15 @@ def clean_business_core(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 # ========== 4. 自适应列宽 ==========
-def auto_adjust_column_width(xlsx_path: Path) -> None:
-    wb = load_workbook(xlsx_path)
-    for ws in wb.worksheets:
-        # 获取所有列的表头（第一行单元格值）
-        headers = [cell.value for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-        for idx, col in enumerate(ws.columns):
-            # 取每一列所有内容的最大长度，并加上列名长度
-            values = [str(cell.value or "") for cell in col]
-            header_len = len(str(headers[idx])) if idx < len(headers) else 0
-            max_length = max([len(v) for v in values] + [header_len])
-            col_letter = col[0].column_letter
-            # print(f"列 {col_letter} 最大长度: {max_length}, 列名长度: {header_len}")
-            ws.column_dimensions[col_letter].width = max_length + 4
-    wb.save(xlsx_path)
+def auto_adjust_column_width(ws, df: pd.DataFrame) -> None:
+    """
+    直接用内存中的 DataFrame 计算每列最大长度（含列名），写入时一并设置，无需再打开工作簿。
+    """
+    for idx, col in enumerate(df.columns):
+        # 空值写出后是空单元格，按长度 0 计
+        lengths = df[col].astype(str).str.len().where(df[col].notna(), 0)
+        max_length = max(int(lengths.max()) if len(df) else 0, len(str(col)))
+        ws.set_column(idx, idx, max_length + 4)
 
 
 
@@ -353,26 +370,15 @@ def auto_adjust_column_width(xlsx_path: Path) -> None:
 
 
 # ========== 5. 套用 Excel Table 样式（可选） ==========
-def apply_excel_table_styles(xlsx_path: Path) -> None:
+def apply_excel_table_styles(ws, df: pd.DataFrame) -> None:
     """
-    将每个 sheet 的数据区域转换为 Excel Table，并应用 TableStyleMedium9 样式。
+    将 sheet 的数据区域转换为 Excel Table，并应用 TableStyleMedium9 样式。
     """
-    wb = load_workbook(xlsx_path)
-    for ws in wb.worksheets:
-        max_row = ws.max_row
-        max_col = ws.max_column
-        ref = f"A1:{get_column_letter(max_col)}{max_row}"
-        tbl = Table(displayName=f"{ws.title}_tbl", ref=ref)
-        style = TableStyleInfo(
-            name="TableStyleMedium9",
-            showFirstColumn=False,
-            showLastColumn=False,
-            showRowStripes=True,
-            showColumnStripes=False,
-        )
-        tbl.tableStyleInfo = style
-        ws.add_table(tbl)
-    wb.save(xlsx_path)
+    ws.add_table(0, 0, len(df), len(df.columns) - 1, {
+        "name": f"{ws.name}_tbl",
+        "style": "Table Style Medium 9",
+        "columns": [{"header": str(c)} for c in df.columns],
+    })
 
 # ========== 6. 保存清洗结果 ==========
 def save_cleaned(df: pd.DataFrame) -> None:
@@ -380,20 +386,21 @@ def save_cleaned(df: pd.DataFrame) -> None:
     logging.info("写出 CSV -> %s", CSV_OUT)
     df.to_csv(CSV_OUT, index=False, encoding="utf-8-sig")
 
-    # 写出 Excel，仅一张 sheet “清洗后业务表”
+    # 写出 Excel，仅一张 sheet “清洗后业务表”；列宽和表格样式在同一次写入中完成
     logging.info("写出 Excel -> %s", XLSX_OUT)
-    with pd.ExcelWriter(XLSX_OUT, engine="openpyxl", mode="w") as writer:
+    # 关闭 strings_to_urls：链接按普通文本写入，避免超出单表 65530 个超链接或超长 URL 时单元格被留空
+    with pd.ExcelWriter(XLSX_OUT, engine="xlsxwriter",
+                        engine_kwargs={"options": {"strings_to_urls": False}}) as writer:
         df.to_excel(writer, sheet_name="清洗后业务表", index=False)
+        ws = writer.sheets["清洗后业务表"]
 
+        # 自适应列宽
+        logging.info("调整列宽自适应内容宽度 -> %s", XLSX_OUT)
+        auto_adjust_column_width(ws, df)
 
-
-    # 自适应列宽
-    logging.info("调整列宽自适应内容宽度 -> %s", XLSX_OUT)
-    auto_adjust_column_width(XLSX_OUT)
-
-    # 套用 Excel Table 样式（可选，如果不需要可注释掉）
-    logging.info("为 sheet 应用 Excel Table 样式 -> %s", XLSX_OUT)
-    apply_excel_table_styles(XLSX_OUT)
+        # 套用 Excel Table 样式（可选，如果不需要可注释掉）
+        logging.info("为 sheet 应用 Excel Table 样式 -> %s", XLSX_OUT)
+        apply_excel_table_styles(ws, df)
 
 
 
@@ -111,7 +111,7 @@ Fort Erie	密西沙加	1
 贝尔维尔	皮尔逊机场	1
 """.strip()
 
-df_manual = pd.read_csv(io.StringIO(data), sep="\t")
+df_manual = pd.read_csv(io.StringIO(data), sep="\t", engine="pyarrow", dtype_backend="pyarrow")
 df = df_manual          # 如果用 Excel，替换成 pd.read_excel(...)
 
 # 若你直接读 Excel sheet: df = sheets['流向统计']
@@ -123,19 +123,17 @@ src, tgt, val = '起点', '终点', '订单数'   # 根据 df 列名修正
 if all(col in df.columns for col in ['起点归一','终点归一']):
     src, tgt = '起点归一', '终点归一'      # 若已归一化列存在则使用
 
+src_s = df[src].astype("string[pyarrow]").str.strip()
+tgt_s = df[tgt].astype("string[pyarrow]").str.strip()
+val_s = pd.to_numeric(df[val], errors='coerce')
+# 一个掩码同时完成去空值和去自循环
+mask = src_s.notna() & tgt_s.notna() & val_s.notna() & (src_s != tgt_s)
+
 df_clean = (
-    df[[src, tgt, val]]
-    .dropna()
-    .assign(**{
-        src: lambda d: d[src].astype(str).str.strip(),
-        tgt: lambda d: d[tgt].astype(str).str.strip(),
-        val: lambda d: pd.to_numeric(d[val], errors='coerce')
-    })
-    .dropna()
-    .loc[lambda d: d[src] != d[tgt]]          # 去自循环
-    .groupby([src, tgt], as_index=False)[val]
+    pd.DataFrame({src: src_s[mask], tgt: tgt_s[mask], val: val_s[mask]})
+    .groupby([src, tgt], as_index=False, observed=True)[val]
     .sum()
-    .loc[lambda d: d[val] >= 3]               # 阈值，可调
+    .query(f"{val} >= 3")                     # 阈值，可调
 )
 
 nodes = [{'name': n} for n in { *df_clean[src], *df_clean[tgt] }]
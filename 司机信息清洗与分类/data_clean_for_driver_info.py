@@ -16,13 +16,15 @@ from __future__ import annotations
 
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, Iterator, Optional
 
 import chardet
 import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 # ========== 配置 ==========
 OUT_DIR = Path(r"E:\kabuda_data_analysis\司机信息数据库")
@@ -42,6 +44,15 @@ TARGET_IDS = [
     'DR059', 'DR062', 'DR063', 'DR064', 'DR150', 'DR219'
 ]
 
+# 清洗用到的正则统一在模块级预编译
+_DIGITS_RE = re.compile(r"\D")
+_PHONE_RE = re.compile(r"^1\d{10}$|^6\d{9}$")
+_EMAIL_RE = re.compile(r"^[\w\.-]+@[\w\.-]+\.\w+$")
+_OTHER_AREA_RE = re.compile(r"其他\(请说明地区\)")
+_JOB_SEP_RE = re.compile(r"[，、]")
+_AREA_SEP_RE = re.compile(r"[，、；;]")
+_MULTI_COMMA_RE = re.compile(r",+")
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s | %(levelname)s | %(message)s",
@@ -50,20 +61,74 @@ logging.basicConfig(
 
 
 # —— 1. 读取原始档案 —— #
-def detect_encoding(fp: Path) -> str:
+# 按 BOM 直接判定编码；UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，需先判断
+BOMS = [
+    (b"\xef\xbb\xbf", "utf-8-sig"),
+    (b"\xff\xfe\x00\x00", "utf-32"),
+    (b"\x00\x00\xfe\xff", "utf-32"),
+    (b"\xff\xfe", "utf-16"),
+    (b"\xfe\xff", "utf-16"),
+]
+
+
+def detect_encoding(fp: Path, sample_size: int = 64 * 1024) -> str:
     with open(fp, "rb") as f:
-        return chardet.detect(f.read())["encoding"] or "utf-8"
+        sample = f.read(sample_size)
+        for bom, enc in BOMS:
+            if sample.startswith(bom):
+                return enc
+        # 先用头部样本检测，置信度不足时才读全文件
+        result = chardet.detect(sample)
+        if (result["confidence"] or 0) < 0.5 and len(sample) == sample_size:
+            result = chardet.detect(sample + f.read())
+    return result["encoding"] or "utf-8"
+
+
+# 流式读取 CSV 时每块的字节数
+CSV_BLOCK_SIZE = 64 << 20
+
+# pd.read_csv 默认识别为缺失值的字符串
+CSV_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
 
 
-def load_raw(fp: Path) -> pd.DataFrame:
+def csv_options(fp: Path) -> Dict[str, object]:
+    enc = detect_encoding(fp)
+    logging.info("检测到编码: %s", enc)
+    # UTF-8 家族走 pyarrow 原生解码（自动跳过 BOM），其余编码由 pyarrow 调 Python 编解码器转码
+    arrow_enc = "utf8" if enc.lower().replace("-", "").replace("_", "") in ("utf8", "utf8sig", "ascii") else enc
+    return dict(
+        read_options=pacsv.ReadOptions(use_threads=True, encoding=arrow_enc, block_size=CSV_BLOCK_SIZE),
+        # 补充内容等自由文本列可能含带引号的多行单元格，分块时需按引号识别行边界
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={c: pa.string() for c in COL_ORDER},
+            include_columns=COL_ORDER,
+            include_missing_columns=True,
+            # 与 pd.read_csv 默认的缺失值标记保持一致
+            null_values=CSV_NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def load_raw(fp: Path) -> Iterator[pd.DataFrame]:
+    """按块读取原始档案：CSV 流式读取（每块约 CSV_BLOCK_SIZE 字节）；Excel 无法流式，整表作为一块返回。"""
     ext = fp.suffix.lower()
     logging.info("加载原始档案: %s", fp)
     if ext == ".csv":
-        enc = detect_encoding(fp)
-        logging.info("检测到编码: %s", enc)
-        return pd.read_csv(fp, encoding=enc, dtype=str)
+        for batch in pacsv.open_csv(fp, **csv_options(fp)):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype)
     elif ext in (".xls", ".xlsx"):
-        return pd.read_excel(fp, dtype=str, engine="openpyxl")
+        # 只解析清洗管道用到的列；用可调用对象过滤，源文件缺列时不报错（由 normalize_na 补齐）
+        wanted = frozenset(COL_ORDER)
+
+        def usecols(col: str) -> bool:
+            return col in wanted
+
+        yield pd.read_excel(fp, dtype=str, engine="calamine", usecols=usecols)
     else:
         raise ValueError(f"不支持的文件类型: {ext}")
 
@@ -81,32 +146,23 @@ COL_ORDER = [
 
 
 def normalize_na(df: pd.DataFrame) -> pd.DataFrame:
-    for c in COL_ORDER:
-        if c not in df:
-            df[c] = np.nan
-        df[c] = (df[c].astype(str)
-                 .replace(["nan", "None", "NaN", ""], "缺失")
-                 .str.strip()
-                 .fillna("缺失"))
-    return df
+    # reindex 一次补齐缺少的列（其余列最终也不输出），整表一次 fillna/astype/replace；
+    # 缺失值先填空串（Arrow 列的 NA 经 astype(str) 会变成 "<NA>"），再统一替换为“缺失”。
+    # 先 replace 再 strip，与逐列处理时的顺序一致
+    df = df.reindex(columns=COL_ORDER).fillna("").astype(str)
+    df = df.replace(["nan", "None", "NaN", ""], "缺失")
+    return df.apply(lambda s: s.str.strip())
 
 
 def clean_contact(df: pd.DataFrame) -> pd.DataFrame:
-    phone_re = re.compile(r"^1\d{10}$|^6\d{9}$")
     # 提取纯数字手机号，校验格式
-    df["手机号"] = (
-        df["手机号"].astype(str)
-        .apply(lambda x: re.sub(r"\D", "", x))
-        .apply(lambda x: x if phone_re.match(x) else "缺失")
-    )
+    digits = df["手机号"].astype(str).str.replace(_DIGITS_RE, "", regex=True)
+    df["手机号"] = digits.where(digits.str.match(_PHONE_RE), "缺失")
     # 简单邮箱格式校验
-    df["邮箱"] = df["邮箱"].apply(
-        lambda x: x if re.match(r"^[\w\.-]+@[\w\.-]+\.\w+$", str(x)) else "缺失"
-    )
+    df["邮箱"] = df["邮箱"].where(df["邮箱"].astype(str).str.match(_EMAIL_RE), "缺失")
     # 微信号长度校验
-    df["微信号"] = df["微信号"].apply(
-        lambda x: x if 3 < len(str(x)) < 50 and x != "缺失" else "缺失"
-    )
+    wx_len = df["微信号"].astype(str).str.len()
+    df["微信号"] = df["微信号"].where(wx_len.gt(3) & wx_len.lt(50) & df["微信号"].ne("缺失"), "缺失")
     return df
 
 
@@ -131,7 +187,7 @@ def clean_area_other(df: pd.DataFrame) -> pd.DataFrame:
         df["活动地区"]
         .astype(str)
         # 删除“其他(请说明地区)”字样
-        .str.replace(r"其他\(请说明地区\)", "", regex=True)
+        .str.replace(_OTHER_AREA_RE, "", regex=True)
         # 去掉前后空白
         .str.strip()
         # 如果空串，则标记“缺失”
@@ -141,56 +197,64 @@ def clean_area_other(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def clean_job_time(df: pd.DataFrame) -> pd.DataFrame:
-    # 职业：不在列表内则标为“其它”或“缺失”
-    valid_jobs = {"学生", "自由职业", "正在兼职", "全职", "待业"}
-    df["职业"] = df["职业"].apply(
-        # lambda x: x if x in valid_jobs else ("缺失" if x in ("缺失","nan","") else "其它")
-        lambda x: x if x in valid_jobs else "缺失" if x in ("缺失", "nan", "") else "缺失"
-    )
-    # 接单时间：用第一个逗号前的时段，无法解析则“缺失”
+    # 职业：不在列表内则标为“缺失”
+    valid_jobs = frozenset({"学生", "自由职业", "正在兼职", "全职", "待业"})
+    df["职业"] = df["职业"].where(df["职业"].isin(valid_jobs), "缺失")
+    # 接单时间：用第一个逗号前的时段（“缺失”本身不含逗号，原样保留）
     df["接单时间"] = (
         df["接单时间"].astype(str)
-        .str.replace(r"[，、]", ",", regex=True)
-        .apply(lambda x: "缺失" if x == "缺失" else x.split(",")[0])
+        .str.replace(_JOB_SEP_RE, ",", regex=True)
+        .str.split(",", n=1).str[0]
     )
     return df
 
 
 def clean_vehicle(df: pd.DataFrame) -> pd.DataFrame:
     # 车型 / 驾照：如果等于“缺失”或文件名后缀(.jpg/.png/.pdf)则标“缺失”，否则保留原值
-    df["车型"] = df["车型"].astype(str).apply(
-        lambda x: "缺失" if x.lower() == "缺失" or re.search(r"\.(jpg|png|pdf)$", x.lower()) else x
-    )
-    df["驾照"] = df["驾照"].astype(str).apply(
-        lambda x: "缺失" if x.lower() == "" or x.lower() == " " else x
-    )
+    vehicle = df["车型"].astype(str)
+    low = vehicle.str.lower()
+    df["车型"] = vehicle.mask(low.eq("缺失") | low.str.endswith((".jpg", ".png", ".pdf")), "缺失")
+    licence = df["驾照"].astype(str)
+    df["驾照"] = licence.mask(licence.str.strip().eq(""), "缺失")
     return df
 
 
 def derive_tags(df: pd.DataFrame) -> pd.DataFrame:
     # “联系方式完整”：手机号/邮箱/微信号 都非“缺失”才标“完整”，否则“不完整”
-    df["联系方式完整"] = df.apply(
-        lambda r: "完整" if all(r[c] != "缺失" for c in ("手机号", "邮箱", "微信号")) else "不完整",
-        axis=1,
-    )
+    contact_ok = df[["手机号", "邮箱", "微信号"]].ne("缺失").all(axis=1)
+    df["联系方式完整"] = np.where(contact_ok, "完整", "不完整")
     # “活跃度标签”：如果“活动地区”非“缺失”且“接单时间”非“缺失”则“活跃”，否则“潜水”
-    df["活跃度标签"] = df.apply(
-        lambda r: "活跃" if r["活动地区"] != "缺失" and r["接单时间"] != "缺失" else "潜水",
-        axis=1,
-    )
+    active = df["活动地区"].ne("缺失") & df["接单时间"].ne("缺失")
+    df["活跃度标签"] = np.where(active, "活跃", "潜水")
     return df
 
 
-def run_clean_pipeline(raw: pd.DataFrame) -> pd.DataFrame:
+# 取值种类很少、在各行反复出现的列，清洗完成后转为分类类型
+CAT_COLS = ["司机等级", "职业", "活跃度标签", "联系方式完整", "车型"]
+
+
+def clean_chunk(raw: pd.DataFrame) -> pd.DataFrame:
+    # 逐行独立的清洗步骤，可在每个分块上单独执行
     return (
         raw.pipe(normalize_na)
         .pipe(clean_contact)
-        .pipe(clean_dates)
         .pipe(clean_area_other)  # 先删“其他(请说明地区)”
         .pipe(clean_job_time)
         .pipe(clean_vehicle)
         .pipe(derive_tags)
-    )[COL_ORDER]
+    )
+
+
+def run_clean_pipeline(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    # 逐块清洗后再拼接，峰值内存只取决于单块大小
+    parts = [clean_chunk(chunk) for chunk in chunks]
+    if not parts:
+        parts = [clean_chunk(pd.DataFrame(columns=COL_ORDER))]
+    df = pd.concat(parts, ignore_index=True)
+    # “提交时间”按整列推断日期格式，放在拼接后处理，结果与分块大小无关
+    df = clean_dates(df)[COL_ORDER]
+    # 各块的类别集合不同，统一在拼接后转为分类类型
+    return df.astype({c: "category" for c in CAT_COLS})
 
 
 # —— 3. 拆表 —— #
@@ -205,7 +269,16 @@ THEME_COLS: Dict[str, list[str]] = {
 
 
 def split_tables(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
-    return {name: df[cols].drop_duplicates() for name, cols in THEME_COLS.items()}
+    # 各主题表都以“自动编号”开头：编号唯一时任何列子集都不会重复，直接切片即可
+    if df["自动编号"].is_unique:
+        return {name: df if cols is COL_ORDER else df[cols] for name, cols in THEME_COLS.items()}
+    # 整行去重只做一次，全量档案直接复用；子表在去重后的（更小的）表上切片再去重，
+    # 保留的行及顺序与直接在原表上逐个去重一致
+    base = df.drop_duplicates()
+    return {
+        name: base if cols is COL_ORDER else base[cols].drop_duplicates()
+        for name, cols in THEME_COLS.items()
+    }
 
 
 # —— 4. 读取并处理“模块化面板” —— #
@@ -215,7 +288,7 @@ def load_and_process_panel(fp: Path) -> Optional[pd.DataFrame]:
         return None
 
     logging.info("加载模块化面板: %s", fp)
-    all_s = pd.read_excel(fp, sheet_name=None, dtype=str)
+    all_s = pd.read_excel(fp, sheet_name=None, dtype=str, engine="calamine")
     key = next(iter(all_s))
     df0 = all_s[key]
 
@@ -227,52 +300,34 @@ def load_and_process_panel(fp: Path) -> Optional[pd.DataFrame]:
     # 标准化活动地区（删除“其他(请说明地区)”，空则“缺失”）
     df0['活动地区'] = (
         df0['活动地区'].astype(str)
-        .str.replace(r'其他\(请说明地区\)', '', regex=True)
-        .str.replace(r'[，、；;]', ',', regex=True)
-        .str.replace(r',+', ',', regex=True)
+        .str.replace(_OTHER_AREA_RE, '', regex=True)
+        .str.replace(_AREA_SEP_RE, ',', regex=True)
+        .str.replace(_MULTI_COMMA_RE, ',', regex=True)
         .str.strip(' ,')
         .replace({'': '缺失', 'nan': '缺失'})
     )
     return df0
 
 
-# 将单元格做自适应列宽
-def auto_adjust_column_width(xlsx_path: Path) -> None:
-    wb = load_workbook(xlsx_path)
-    for ws in wb.worksheets:
-        for col in ws.columns:
-            max_length = max(len(str(cell.value or "")) for cell in col)
-            col_letter = col[0].column_letter
-            ws.column_dimensions[col_letter].width = max_length + 2
-    wb.save(xlsx_path)
-
-
-# ========== 新增：为每个 sheet 套用 Excel Table 样式（可选） ==========
-from openpyxl.worksheet.table import Table, TableStyleInfo
-from openpyxl.utils import get_column_letter
-
-
-def apply_excel_table_styles(xlsx_path: Path) -> None:
+# ========== 写 sheet：同时设置自适应列宽 + 套用 Excel Table 样式 ==========
+def write_sheet(writer: pd.ExcelWriter, df: pd.DataFrame, sheet_name: str) -> None:
     """
-    把每个 sheet 的数据区域转换为一个 Excel Table，并套用 TableStyleMedium9 样式。
+    用 xlsxwriter 写出一个 sheet，列宽直接按 DataFrame 内容（含表头）计算，
+    并把数据区域转换为 Excel Table，套用 TableStyleMedium9 样式，无需写完后再打开工作簿。
     """
-    wb = load_workbook(xlsx_path)
-    for ws in wb.worksheets:
-        max_row = ws.max_row
-        max_col = ws.max_column
-        # 数据区域从 A1 到最右下角
-        ref = f"A1:{get_column_letter(max_col)}{max_row}"
-        tbl = Table(displayName=f"{ws.title}_tbl", ref=ref)
-        style = TableStyleInfo(
-            name="TableStyleMedium9",
-            showFirstColumn=False,
-            showLastColumn=False,
-            showRowStripes=True,
-            showColumnStripes=False,
-        )
-        tbl.tableStyleInfo = style
-        ws.add_table(tbl)
-    wb.save(xlsx_path)
+    df.to_excel(writer, sheet_name=sheet_name, index=False)
+    ws = writer.sheets[sheet_name]
+    for idx, col in enumerate(df.columns):
+        # 空值写出后是空单元格，按长度 0 计
+        lengths = df[col].astype(str).str.len().where(df[col].notna(), 0)
+        max_length = max(int(lengths.max()) if len(df) else 0, len(str(col)))
+        ws.set_column(idx, idx, max_length + 2)
+    if len(df.columns):
+        ws.add_table(0, 0, len(df), len(df.columns) - 1, {
+            "name": f"{sheet_name}_tbl",
+            "style": "Table Style Medium 9",
+            "columns": [{"header": str(c)} for c in df.columns],
+        })
 
 
 # ========== 新增：统计每个地区的司机数量 ==========
@@ -283,70 +338,71 @@ def count_by_region(df: pd.DataFrame) -> pd.DataFrame:
     则该司机会被计入所有对应地区。
     返回一个 DataFrame，包含“活动地区”和对应的“司机数量”，按数量降序排序。
     """
-    # 1. 确保“活动地区”列为字符串并按英文逗号拆分成列表
-    temp = df.copy()
-    temp["活动地区"] = temp["活动地区"].astype(str).str.split(",")
+    # 1. 只取“活动地区”一列，按英文逗号拆分后展开，每行只保留一个地区
+    regions = df["活动地区"].astype(str).str.split(",").explode()
 
-    # 2. 拆分后展开，每行只保留一个地区
-    temp = temp.explode("活动地区")
-
-    # 3. 去掉前后空白，如果拆分后是空串则标“缺失”
-    temp["活动地区"] = (
-        temp["活动地区"]
-        .str.strip()
-        .replace({"": "缺失"})
-    )
+    # 2. 去掉前后空白，如果拆分后是空串则标“缺失”
+    regions = regions.str.strip().replace({"": "缺失"})
 
-    # 4. 按“活动地区”分组计数
+    # 3. 按地区计数后按司机数量降序
     region_counts = (
-        temp.groupby("活动地区")
+        regions.groupby(regions)
         .size()
+        .sort_values(ascending=False)
+        .rename_axis("活动地区")
         .reset_index(name="司机数量")
-        .sort_values("司机数量", ascending=False)
-        .reset_index(drop=True)
     )
 
     return region_counts
 
 
 # —— 5. 保存所有输出 —— #
-def save_all(full: pd.DataFrame,
-             tables: Dict[str, pd.DataFrame],
-             panel_df: Optional[pd.DataFrame]) -> None:
-    # 写出 CSV
+def write_csv(full: pd.DataFrame) -> None:
     logging.info("写出 CSV -> %s", CSV_OUT)
     full.to_csv(CSV_OUT, index=False, encoding="utf-8-sig")
 
+
+def write_excel(full: pd.DataFrame,
+                tables: Dict[str, pd.DataFrame],
+                panel_df: Optional[pd.DataFrame]) -> None:
     # 写出 Excel 含多个 sheet
     logging.info("写出 Excel -> %s", XLSX_OUT)
-    with pd.ExcelWriter(XLSX_OUT, engine="openpyxl", mode="w") as writer:
+    # constant_memory 要求按行顺序写入且不支持 add_table，to_excel 按列写出，故不启用；
+    # 关闭 strings_to_urls：链接按普通文本写入，避免超出单表 65530 个超链接或超长 URL 时单元格被留空
+    with pd.ExcelWriter(XLSX_OUT, engine="xlsxwriter",
+                        engine_kwargs={"options": {"strings_to_urls": False}}) as writer:
         # 主表
-        full.to_excel(writer, sheet_name="司机全量档案", index=False)
+        write_sheet(writer, full, "司机全量档案")
         # 拆分的子表
         for nm, df_ in tables.items():
             if nm == "司机全量档案":
                 continue
-            df_.to_excel(writer, sheet_name=nm, index=False)
+            write_sheet(writer, df_, nm)
         # 模块化面板（如果有），新 sheet
         if panel_df is not None:
-            panel_df.to_excel(writer, sheet_name="面板模块化输出", index=False)
+            write_sheet(writer, panel_df, "面板模块化输出")
         # 统计每个地区的司机数量
         # —— 新增：写入“地区统计”sheet —— #
         logging.info("写入地区统计 -> %s", XLSX_OUT)
         region_df = count_by_region(full)
-        region_df.to_excel(writer, sheet_name="地区统计", index=False)
-    # 自动调整列宽
-    logging.info("调整列宽自适应内容宽度 -> %s", XLSX_OUT)
-    auto_adjust_column_width(XLSX_OUT)
+        write_sheet(writer, region_df, "地区统计")
+
 
-    # （可选）为所有 sheet 应用 Excel Table 样式
-    logging.info("为所有 sheet 应用 Excel Table 样式 -> %s", XLSX_OUT)
-    apply_excel_table_styles(XLSX_OUT)
+def save_all(full: pd.DataFrame,
+             tables: Dict[str, pd.DataFrame],
+             panel_df: Optional[pd.DataFrame]) -> None:
+    # CSV 与 Excel 写到不同文件、互不依赖，两路并行，总耗时取两者较长者
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = [
+            ex.submit(write_csv, full),
+            ex.submit(write_excel, full, tables, panel_df),
+        ]
+        for fut in futures:
+            fut.result()  # 任一路出错时在此抛出
 
 
 def main():
-    raw_df = load_raw(RAW_FILE)
-    clean_df = run_clean_pipeline(raw_df)
+    clean_df = run_clean_pipeline(load_raw(RAW_FILE))
     tables = split_tables(clean_df)
 
     panel_df = load_and_process_panel(PANEL_INPUT)